@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 """
-Push-to-Talk Speech-to-Text Tool using OpenAI Whisper
+Push-to-Talk Speech-to-Text Tool using Whisper (faster-whisper / CTranslate2)
 Records audio while holding a key, transcribes on release, and types the result.
 """
 
+import contextlib
+import math
+import os
 import threading
 import queue
 import time
 import numpy as np
 import sounddevice as sd
-import whisper
+from numba import njit
+import ctranslate2
+from faster_whisper import WhisperModel
+from faster_whisper.vad import get_speech_timestamps
 from pynput import keyboard
 from pynput.keyboard import Key, KeyCode, Listener
 import sys
@@ -17,8 +23,97 @@ import tkinter as tk
 from tkinter import ttk
 
 
+# Where whisper_trt stores its compiled TensorRT engines
+WHISPER_TRT_CACHE_DIR = os.path.expanduser("~/.cache/whisper_trt")
+
+# 5-bit quantization of each published whisper.cpp model. Small models ship as
+# q5_1, medium/large as q5_0; large-v1 has no quantized release (None).
+WHISPER_CPP_QUANT = {
+    "tiny": "q5_1", "tiny.en": "q5_1",
+    "base": "q5_1", "base.en": "q5_1",
+    "small": "q5_1", "small.en": "q5_1",
+    "medium": "q5_0", "medium.en": "q5_0",
+    "large-v1": None,
+    "large-v2": "q5_0",
+    "large-v3": "q5_0",
+    "large-v3-turbo": "q5_0",
+}
+
+# Directory of the INT8 OpenVINO export, next to this script (see README for the
+# optimum-cli command)
+OPENVINO_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "whisper_{model_size}_ov_int8")
+
+# Longest recording kept in the capture buffer, in seconds
+MAX_RECORDING_SECONDS = 120
+
+# CPU threads for the CPU backends: the cores this process may actually run on
+# (respects affinity/cpusets in containers), not every logical CPU on the host
+if hasattr(os, "sched_getaffinity"):
+    CPU_THREADS = len(os.sched_getaffinity(0))
+else:
+    CPU_THREADS = os.cpu_count() or 4
+
+
+@njit(cache=True, fastmath=True)
+def _audio_stats(x):
+    """Return (rms, peak) of a 1-D audio array in a single fused pass."""
+    ss = 0.0
+    peak = 0.0
+    for i in range(x.size):
+        v = x[i]
+        ss += v * v
+        a = abs(v)
+        if a > peak:
+            peak = a
+    return math.sqrt(ss / x.size), peak
+
+
+class AudioBuffer:
+    """
+    Preallocated single-producer/single-consumer sample buffer.
+    
+    The audio callback is the only writer and publishes new samples by advancing
+    `head` after they are copied in; the transcription side only reads
+    `[tail:head]`. Each index update is a single assignment (atomic under the GIL),
+    so neither side ever has to take a lock.
+    """
+    
+    def __init__(self, capacity, dtype=np.int16):
+        self._buf = np.empty(capacity, dtype=dtype)
+        self.head = 0
+        self.tail = 0
+    
+    def __len__(self):
+        return self.head - self.tail
+    
+    def reset(self):
+        """Discard all samples. Only call while the producer is idle."""
+        self.head = 0
+        self.tail = 0
+    
+    def write(self, samples):
+        """Append samples (producer side). Samples past the capacity are dropped."""
+        head = self.head
+        n = min(len(samples), len(self._buf) - head)
+        np.copyto(self._buf[head:head + n], samples[:n])
+        self.head = head + n
+    
+    def read(self):
+        """
+        Return all unread samples (consumer side).
+        
+        The result is a contiguous view into the buffer, not a copy, so it is
+        only valid until the next reset().
+        """
+        head = self.head
+        data = self._buf[self.tail:head]
+        self.tail = head
+        return data
+
+
 class PushToTalkSTT:
-    def __init__(self, trigger_key=Key.ctrl_r, model_size="base", sample_rate=16000):
+    def __init__(self, trigger_key=Key.ctrl_r, model_size="base", sample_rate=16000,
+                 backend="faster_whisper", language="en"):
         """
         Initialize the Push-to-Talk Speech-to-Text tool.
         
@@ -26,28 +121,144 @@ class PushToTalkSTT:
             trigger_key: The key to hold for recording (default: Right Shift)
             model_size: Whisper model size (default: "base")
             sample_rate: Audio sample rate in Hz (default: 16000)
+            backend: Inference backend, "faster_whisper" (default),
+                "whisper_trt" (TensorRT, NVIDIA GPUs only) or
+                "whisper_cpp" (whisper.cpp, AVX/NEON with 5-bit weights) or
+                "openvino" (OpenVINO INT8, Intel CPUs)
+            language: Spoken language code, or None to auto-detect (default: "en").
+                Always "en" for English-only ".en" models.
         """
         self.trigger_key = trigger_key
+        # Decide once how to match the trigger key so the per-event check is a single call.
+        # Use equality, not identity: pynput creates a new KeyCode for every event.
+        if isinstance(trigger_key, str):
+            self._matches = lambda key: getattr(key, 'char', None) == trigger_key
+        else:
+            self._matches = lambda key: key == trigger_key
         self.sample_rate = sample_rate
+        self.backend = backend
+        # A known language skips Whisper's language-detection pass on every recording
+        self.multilingual = not model_size.endswith(".en")
+        self.language = language if self.multilingual else "en"
         self.is_recording = False
-        self.audio_queue = queue.Queue()
-        self.recording_thread = None
-        self.transcription_thread = None
-        self.audio_buffer = []
-        self.stream = None
+        # Set on key release so the callback also keeps the block that was in
+        # flight when the key came up; _flushed is signalled once it has
+        self._flush_pending = False
+        self._flushed = threading.Event()
+        self._work_q = queue.SimpleQueue()
         self.recording_lock = threading.Lock()
         
+        # Preallocated 16-bit PCM capture buffer so the audio callback never allocates or locks
+        self.audio_buffer = AudioBuffer(self.sample_rate * MAX_RECORDING_SECONDS, dtype=np.int16)
+        
         # Create overlay widget
         self._create_overlay()
         
         # Load Whisper model once at startup
-        print(f"Loading Whisper model ({model_size})... This may take a moment.")
-        self.model = whisper.load_model(model_size)
+        print(f"Loading Whisper model ({model_size}, {backend})... This may take a moment.")
+        self._model_warmed_up = False
+        self.model = self._load_model(model_size)
+        self._warm_up()
         print("Model loaded successfully!")
         
+        # Keep one input stream running for the whole session; opening a stream
+        # per key press costs tens to hundreds of milliseconds
+        self.stream = sd.InputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype='int16',  # native PCM, half the bytes of float32
+            blocksize=256,  # 16ms blocks
+            latency='low',
+            callback=self._audio_callback
+        )
+        self.stream.start()
+        
+        # One long-lived worker transcribes recordings in order, so the model's
+        # caches stay warm and no thread is spawned per utterance
+        self.transcription_thread = threading.Thread(target=self._transcription_worker, daemon=True)
+        self.transcription_thread.start()
+        
         # Keyboard controller for typing
         self.keyboard_controller = keyboard.Controller()
     
+    def _load_model(self, model_size):
+        """Load the Whisper model for the selected backend."""
+        if self.backend == "faster_whisper":
+            # FP16 on CUDA uses the tensor cores; on CPU, INT8 weights are
+            # much faster than FP32
+            if ctranslate2.get_cuda_device_count() > 0:
+                try:
+                    self.model = WhisperModel(model_size, device="cuda", compute_type="float16")
+                    # A GPU alone isn't enough - missing cuBLAS/cuDNN libraries
+                    # only show up once the model actually runs. This run
+                    # doubles as the warm-up.
+                    self._run_model(np.zeros(self.sample_rate, dtype=np.float32))
+                    self._model_warmed_up = True
+                    return self.model
+                except Exception as e:
+                    print(f"Warning: CUDA inference unavailable ({e}), falling back to CPU.")
+            # CTranslate2 only uses 4 threads by default
+            return WhisperModel(model_size, device="cpu", compute_type="int8",
+                                cpu_threads=CPU_THREADS)
+        elif self.backend == "whisper_trt":
+            # Imported lazily - only available on CUDA/TensorRT hosts.
+            # The first run builds the engine, later runs load it from the cache.
+            import torch
+            from whisper_trt import load_trt_model
+            torch.backends.cudnn.benchmark = True
+            os.makedirs(WHISPER_TRT_CACHE_DIR, exist_ok=True)
+            engine_path = os.path.join(WHISPER_TRT_CACHE_DIR, f"{model_size}_trt.pth")
+            # whisper's mel_filters() is lru_cached, so the warm-up run in
+            # _warm_up() already loads the filterbank before the first recording
+            return load_trt_model(model_size, path=engine_path)
+        elif self.backend == "whisper_cpp":
+            # pywhispercpp downloads the GGML model on first use
+            from pywhispercpp.model import Model
+            if model_size not in WHISPER_CPP_QUANT:
+                raise ValueError(f"Unknown whisper.cpp model size: {model_size} "
+                                 f"(expected one of {', '.join(WHISPER_CPP_QUANT)})")
+            quant = WHISPER_CPP_QUANT[model_size]
+            model_name = f"{model_size}-{quant}" if quant else model_size
+            return Model(model_name, n_threads=CPU_THREADS)
+        elif self.backend == "openvino":
+            import openvino_genai as ov_genai
+            model_dir = OPENVINO_MODEL_DIR.format(model_size=model_size)
+            return ov_genai.WhisperPipeline(model_dir, "CPU")
+        else:
+            raise ValueError(f"Unknown backend: {self.backend}")
+    
+    def _warm_up(self):
+        """Run the model once on silence so the first real recording isn't slowed down by one-time setup."""
+        try:
+            silence = np.zeros(self.sample_rate, dtype=np.float32)
+            _audio_stats(silence)  # JIT-compiles (or loads from cache) up front
+            get_speech_timestamps(silence, sampling_rate=self.sample_rate)  # creates the VAD session
+            if not self._model_warmed_up:
+                self._run_model(silence)
+        except Exception as e:
+            print(f"Warning: Model warm-up failed: {e}")
+    
+    def _run_model(self, audio_data):
+        """Run the loaded model on float32 mono audio and return the text."""
+        if self.backend == "whisper_trt":
+            result = self.model.transcribe(audio_data)
+            return result["text"]
+        if self.backend == "whisper_cpp":
+            segments = self.model.transcribe(audio_data, language=self.language or "auto")
+            return " ".join(s.text for s in segments)
+        if self.backend == "openvino":
+            # English-only models reject task/language in their generation config
+            kwargs = {}
+            if self.multilingual:
+                kwargs["task"] = "transcribe"
+                if self.language:
+                    kwargs["language"] = f"<|{self.language}|>"
+            result = self.model.generate(audio_data.tolist(), max_new_tokens=224, **kwargs)
+            return result.texts[0]
+        segments, _ = self.model.transcribe(audio_data, language=self.language, task="transcribe",
+                                            beam_size=1, vad_filter=False)
+        return "".join(s.text for s in segments)
+    
     def _create_overlay(self):
         """Create a small always-on-top overlay window."""
         self.root = tk.Tk()
@@ -74,28 +285,8 @@ class PushToTalkSTT:
         self.status_label.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         self.root.configure(bg="black")
-        
-        # Make window update periodically
-        def periodic_update():
-            try:
-                self.root.update_idletasks()
-                self.root.update()
-                self.root.after(50, periodic_update)  # Update every 50ms
-            except:
-                pass
-        
-        # Start periodic updates
-        self.root.after(50, periodic_update)
-        
-        # Update thread for GUI mainloop
-        def update_gui():
-            try:
-                self.root.mainloop()
-            except:
-                pass
-        
-        gui_thread = threading.Thread(target=update_gui, daemon=True)
-        gui_thread.start()
+        # The event loop runs in start(), on this (main) thread - Tk must be
+        # driven from the thread that created it
     
     def _update_status(self, status, color):
         """Update the overlay status display (thread-safe)."""
@@ -107,129 +298,82 @@ class PushToTalkSTT:
         
     def on_key_press(self, key):
         """Handle key press events."""
-        # Check if the trigger key is pressed
-        # Handle both Key objects and character keys (KeyCode)
-        key_matches = False
-        if isinstance(self.trigger_key, str):
-            # Character key - check if it matches
-            if hasattr(key, 'char') and key.char == self.trigger_key:
-                key_matches = True
-        else:
-            # Special key (Key object)
-            if key == self.trigger_key:
-                key_matches = True
-        
-        if key_matches:
+        if self._matches(key):
             with self.recording_lock:
                 if not self.is_recording:
+                    # Reset before arming the callback: the stream is always
+                    # running, so the buffer is only idle while not recording
+                    self._flush_pending = False
+                    self.audio_buffer.reset()
                     self.is_recording = True
-                    self.audio_buffer = []
                     print("Recording started... (hold key to record)")
                     self._update_status("● RECORDING", "red")
-                    
-                    # Start recording in a separate thread
-                    self.recording_thread = threading.Thread(target=self._record_audio, daemon=True)
-                    self.recording_thread.start()
         # Ignore key repeats - the flag prevents restarting
     
     def on_key_release(self, key):
         """Handle key release events."""
-        # Handle both Key objects and character keys (KeyCode)
-        key_matches = False
-        if isinstance(self.trigger_key, str):
-            # Character key - check if it matches
-            if hasattr(key, 'char') and key.char == self.trigger_key:
-                key_matches = True
-        else:
-            # Special key (Key object)
-            if key == self.trigger_key:
-                key_matches = True
-        
-        if key_matches:
+        if self._matches(key):
             with self.recording_lock:
                 if self.is_recording:
+                    self._flushed.clear()
+                    self._flush_pending = True
                     self.is_recording = False
                     print("Recording stopped. Processing...")
                     self._update_status("● Processing...", "yellow")
                     
-                    # Wait a moment for the recording thread to finish capturing
-                    time.sleep(0.2)
+                    # Wait for the callback to deliver the last block (~16 ms)
+                    self._flushed.wait(timeout=0.1)
                     
-                    # Process the recorded audio
-                    if self.audio_buffer:
-                        self._process_audio()
+                    # Hand a snapshot to the worker; the capture buffer is
+                    # reused as soon as the key is pressed again
+                    if len(self.audio_buffer):
+                        self._work_q.put(self._snapshot_audio())
                     else:
                         print("No audio captured.")
                         self._update_status("● Ready", "gray")
     
-    def _record_audio(self):
-        """Record audio in a separate thread while is_recording is True."""
-        try:
-            # Use callback-based recording for better reliability
-            def audio_callback(indata, frames, time_info, status):
-                if status:
-                    print(f"Audio status: {status}")
-                if self.is_recording:
-                    # Make a copy of the data to avoid issues
-                    self.audio_buffer.append(indata.copy().flatten())
-            
-            # Start the stream with callback
-            self.stream = sd.InputStream(
-                samplerate=self.sample_rate,
-                channels=1,
-                dtype='float32',
-                blocksize=int(self.sample_rate * 0.1),  # 100ms blocks
-                callback=audio_callback
-            )
-            
-            self.stream.start()
-            
-            # Small delay to ensure stream is ready
-            time.sleep(0.1)
-            
-            # Keep recording while flag is True
-            while self.is_recording:
-                time.sleep(0.05)  # Small sleep to prevent busy waiting
-            
-            # Stop the stream
-            if self.stream:
-                self.stream.stop()
-                self.stream.close()
-                self.stream = None
-                
-        except Exception as e:
-            print(f"Error during recording: {e}")
-            import traceback
-            traceback.print_exc()
-            with self.recording_lock:
-                self.is_recording = False
-            self._update_status("● Error", "red")
+    def _audio_callback(self, indata, frames, time_info, status):
+        """Stream callback (PortAudio thread): keep blocks only while recording."""
+        if status:
+            print(f"Audio status: {status}")
+        if self.is_recording:
+            self.audio_buffer.write(indata[:, 0])
+        elif self._flush_pending:
+            # First block after key release - it still holds the end of the recording
+            self.audio_buffer.write(indata[:, 0])
+            self._flush_pending = False
+            self._flushed.set()
+    
+    def _snapshot_audio(self):
+        """Copy the recording out of the capture buffer as float32 in [-1, 1)."""
+        # The int16 -> float32 conversion is the copy; the scale is applied in place
+        audio_data = self.audio_buffer.read().astype(np.float32)
+        audio_data *= 1.0 / 32768.0
+        return audio_data
     
-    def _process_audio(self):
-        """Process recorded audio and transcribe it."""
-        # Run transcription in a separate thread to avoid blocking
-        transcription_thread = threading.Thread(target=self._transcribe_and_type, daemon=True)
-        transcription_thread.start()
+    def _transcription_worker(self):
+        """Transcribe recordings from the work queue, one at a time."""
+        # PyTorch grad mode is per-thread, so inference mode is entered once here
+        # rather than paying autograd bookkeeping on every transcription
+        context = contextlib.nullcontext()
+        if self.backend == "whisper_trt":
+            import torch
+            context = torch.inference_mode()
+        with context:
+            while True:
+                audio_data = self._work_q.get()
+                self._transcribe_and_type(audio_data)
     
-    def _transcribe_and_type(self):
+    def _transcribe_and_type(self, audio_data):
         """Transcribe audio and type the result."""
         try:
-            # Concatenate all audio chunks
-            if not self.audio_buffer:
-                print("No audio buffer to process.")
-                self._update_status("● Ready", "gray")
-                return
-            
-            audio_data = np.concatenate(self.audio_buffer)
-            
             # Debug info
             print(f"Audio length: {len(audio_data) / self.sample_rate:.2f} seconds")
             print(f"Audio shape: {audio_data.shape}")
             
             # Check for silence/empty audio
-            # Calculate RMS (Root Mean Square) to detect silence
-            rms = np.sqrt(np.mean(audio_data**2))
-            max_amplitude = np.abs(audio_data).max()
+            # Calculate RMS (Root Mean Square) and peak in one compiled pass
+            rms, max_amplitude = _audio_stats(audio_data)
             print(f"RMS: {rms:.6f}, Max amplitude: {max_amplitude:.6f}")
             
             # More lenient thresholds
@@ -250,19 +394,30 @@ class PushToTalkSTT:
                 self._update_status("● Ready", "gray")
                 return
             
-            # Normalize audio to [-1, 1] range if needed
-            max_val = np.abs(audio_data).max()
-            if max_val > 0:
-                audio_data = audio_data / max_val
+            # The log-mel frontend is insensitive to overall gain, so only boost
+            # very quiet recordings instead of peak-normalizing every one
+            # (before VAD, so quiet speech isn't discarded as silence)
+            if max_amplitude < 0.05:
+                np.multiply(audio_data, 0.5 / max_amplitude, out=audio_data)
             
-            # Ensure audio is in the right format for Whisper (float32, mono)
-            if audio_data.dtype != np.float32:
-                audio_data = audio_data.astype(np.float32)
+            # Keep only the speech regions found by Silero VAD so the model
+            # doesn't spend encoder/decoder time on pauses and trailing silence
+            speech = get_speech_timestamps(audio_data, sampling_rate=self.sample_rate)
+            if not speech:
+                print("No speech detected, skipping.")
+                self._update_status("● Silence", "orange")
+                time.sleep(1)
+                self._update_status("● Ready", "gray")
+                return
+            if len(speech) == 1:
+                audio_data = audio_data[speech[0]["start"]:speech[0]["end"]]
+            else:
+                audio_data = np.concatenate([audio_data[t["start"]:t["end"]] for t in speech])
+            print(f"Speech length: {len(audio_data) / self.sample_rate:.2f} seconds")
             
             # Transcribe using Whisper
             print("Transcribing...")
-            result = self.model.transcribe(audio_data, language=None, fp16=False)
-            text = result["text"].strip()
+            text = self._run_model(audio_data).strip()
             
             if text:
                 print(f"Transcribed: {text}")
@@ -289,17 +444,15 @@ class PushToTalkSTT:
             # Small delay to ensure focus is on the target window
             time.sleep(0.1)
             
-            # Type the text character by character
-            for char in text:
-                self.keyboard_controller.type(char)
-                time.sleep(0.01)  # Small delay between characters for reliability
+            # Type the whole string in one call instead of one character at a time
+            self.keyboard_controller.type(text)
             
             print("Text typed successfully.")
         except Exception as e:
             print(f"Error typing text: {e}")
     
     def start(self):
-        """Start the keyboard listener."""
+        """Start the keyboard listener and run the overlay until Esc is pressed."""
         print(f"\nPush-to-Talk Speech-to-Text Tool")
         if isinstance(self.trigger_key, str):
             key_name = self.trigger_key.upper()
@@ -338,8 +491,8 @@ class PushToTalkSTT:
                     except:
                         pass
                 try:
-                    self.root.quit()
-                    self.root.destroy()
+                    # Runs on the Tk thread; destroying the root ends mainloop()
+                    self.root.after(0, self.root.destroy)
                 except:
                     pass
                 return False
@@ -347,9 +500,14 @@ class PushToTalkSTT:
         def on_release(key):
             self.on_key_release(key)
         
-        # Start the keyboard listener
-        with Listener(on_press=on_press, on_release=on_release) as listener:
-            listener.join()
+        # Listen for keys in the background so the main thread can run Tk.
+        # Tk is driven only by its own mainloop; _update_status() wakes it with after()
+        listener = Listener(on_press=on_press, on_release=on_release)
+        listener.start()
+        try:
+            self.root.mainloop()
+        finally:
+            listener.stop()
 
 
 def main():
@@ -364,8 +522,19 @@ def main():
     
     trigger_key = Key.ctrl_r  # Right Ctrl - hold to record, won't interfere with typing
     
+    # Inference backend:
+    # "faster_whisper" = CTranslate2 INT8 on CPU (default, works everywhere)
+    # "whisper_trt" = TensorRT engine on NVIDIA GPUs (requires whisper_trt, English models only)
+    # "whisper_cpp" = whisper.cpp with 5-bit weights, good for laptops/Raspberry Pi (requires pywhispercpp)
+    # "openvino" = OpenVINO INT8 on Intel CPUs (requires openvino-genai and a one-time export, see README)
+    backend = "faster_whisper"
+    
+    # Spoken language ("en", "de", ...), or None to auto-detect on every recording (slower)
+    language = "en"
+    
     try:
-        app = PushToTalkSTT(trigger_key=trigger_key, model_size="base")
+        app = PushToTalkSTT(trigger_key=trigger_key, model_size="base", backend=backend,
+                            language=language)
         app.start()
     except KeyboardInterrupt:
         print("\nExiting...")